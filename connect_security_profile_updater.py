@@ -1,113 +1,376 @@
 #!/usr/bin/env python3
 """
 Amazon Connect Security Profile Updater
-This script updates user security profiles in Amazon Connect using AWS CLI.
+This script updates user security profiles in Amazon Connect using boto3.
 It reads usernames and security profile ids from a CSV file. It then searches Amazon Connect
 for that username and finds the matching userid. The script then updates the security profile id
 for that user.
 """
 
 import argparse
+import asyncio
+import atexit
+import contextlib
 import csv
-import subprocess
+import functools
 import logging
+import logging.handlers
 import sys
 import os
-import json
+import re
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
 from datetime import datetime
 
+import boto3
+from botocore.config import Config
+from botocore.exceptions import BotoCoreError, ClientError
+
+try:
+    import aioboto3
+except ImportError:
+    aioboto3 = None
+
+try:
+    from tqdm import tqdm
+    from tqdm.contrib.logging import logging_redirect_tqdm
+except ImportError:
+    tqdm = None
+
+# orjson is faster when available; both work on bytes here
+try:
+    import orjson as _json
+except ImportError:
+    import json as _json
+
+# Marks per-row log records that stay out of the console when a progress bar is shown.
+PER_ROW_LOG = {'per_row': True}
+
+# Number of rows processed concurrently.
+MAX_WORKERS = 16
+
+# Column order expected in the CSV file.
+CSV_FIELDNAMES = ['username', 'security_profile_id']
+
+# First-column values that mark a header row.
+_HEADER_TOKENS = frozenset({'user_id', 'userid', 'username'})
+
+# How long cached user IDs stay valid, in seconds.
+USER_CACHE_TTL = 24 * 60 * 60
+
+# Security profile IDs are UUIDs.
+SECURITY_PROFILE_ID_PATTERN = re.compile(
+    r'^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$',
+    re.IGNORECASE
+)
+
+# Read buffer for the CSV file, large enough to load most files in one read.
+CSV_READ_BUFFER_SIZE = 1 << 20
+
+# Number of updates kept in flight when running with aioboto3.
+ASYNC_CONCURRENCY = 64
+
+# Number of usernames resolved per search_users request.
+SEARCH_BATCH_SIZE = 50
+
+# Largest page sizes the ListUsers and SearchUsers APIs accept.
+# ListUsers otherwise defaults to 100 users per page.
+LIST_USERS_PAGE_SIZE = 1000
+SEARCH_USERS_PAGE_SIZE = 500
+
+# Shared client settings. Adaptive retries rate-limit the client when Connect
+# starts throttling, the connection pool is sized so the client can be shared
+# across worker threads, and the timeouts apply to each individual request.
+CLIENT_CONFIG = Config(
+    retries={'mode': 'adaptive', 'max_attempts': 8},
+    max_pool_connections=MAX_WORKERS,
+    connect_timeout=5,
+    read_timeout=30
+)
+
+_connect_client = None
+_connect_client_lock = threading.Lock()
+
 def setup_logging():
     """Setup logging configuration with timestamped log file."""
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
     log_filename = f"connect_security_update_{timestamp}.log"
     
+    # Buffer file records so writing the log stays off the per-row path.
+    # Errors flush immediately and anything left is flushed at exit.
+    file_handler = logging.FileHandler(log_filename)
+    file_handler.setLevel(logging.INFO)
+    memory_handler = logging.handlers.MemoryHandler(
+        capacity=1000,
+        flushLevel=logging.ERROR,
+        target=file_handler
+    )
+    atexit.register(memory_handler.flush)
+    
+    # With a progress bar on screen, per-row results only go to the log file
+    console_handler = logging.StreamHandler(sys.stdout)
+    if tqdm is not None:
+        console_handler.addFilter(lambda record: not getattr(record, 'per_row', False))
+    
     logging.basicConfig(
         level=logging.INFO,
         format='%(asctime)s - %(levelname)s - %(message)s',
         handlers=[
-            logging.FileHandler(log_filename),
-            logging.StreamHandler(sys.stdout)
+            memory_handler,
+            console_handler
         ]
     )
+    # basicConfig only sets the formatter on the handlers it is given
+    file_handler.setFormatter(memory_handler.formatter)
     
     return log_filename
 
+
+@contextlib.contextmanager
+def progress_bar(total):
+    """
+    Show a console progress bar while users are updated, if tqdm is installed.
+    Yields a callable that advances the bar by one. Console logging is
+    routed through tqdm so failures print above the bar.
+    """
+    if tqdm is None:
+        yield lambda: None
+        return
+    
+    with tqdm(total=total, unit='user', desc='Updating users') as bar, logging_redirect_tqdm():
+        yield bar.update
+
+
+def get_connect_client():
+    """
+    Return the shared Amazon Connect client, creating it on first use.
+    The client keeps its connection pool alive so every row reuses it.
+    Creation is locked because worker threads may be the first callers.
+    """
+    global _connect_client
+    if _connect_client is None:
+        with _connect_client_lock:
+            if _connect_client is None:
+                session = boto3.session.Session()
+                _connect_client = session.client('connect', config=CLIENT_CONFIG)
+    return _connect_client
+
+
+def format_client_error(e):
+    """Build a readable message from a botocore ClientError."""
+    error = e.response.get('Error', {})
+    code = error.get('Code', 'Unknown')
+    message = error.get('Message', str(e))
+    return f"{code}: {message}"
+
+
+class UserLookupError(LookupError):
+    """Raised when a username cannot be resolved to a single user ID."""
+
+
+@functools.lru_cache(maxsize=10000)
+def _lookup_user_id(instance_id, username):
+    """
+    Resolve a username to its user ID, caching successful lookups.
+    Failures raise UserLookupError so they are never cached.
+    """
+    try:
+        response = get_connect_client().search_users(
+            InstanceId=instance_id,
+            SearchCriteria=_username_condition(username)
+        )
+    except ClientError as e:
+        raise UserLookupError(f"Search request failed: {format_client_error(e)}") from e
+    except BotoCoreError as e:
+        raise UserLookupError(f"Search request failed: {str(e)}") from e
+    
+    users = response.get('Users', [])
+    
+    if not users:
+        raise UserLookupError(f"No user found with username: {username}")
+    
+    if len(users) > 1:
+        raise UserLookupError(f"Multiple users found with username: {username}")
+    
+    user_id = users[0].get('Id')
+    if not user_id:
+        raise UserLookupError(f"User ID not found in response for username: {username}")
+    
+    return user_id
+
+
 def search_user_by_username(instance_id, username):
     """
     Search for a user by username to get their user ID.
+    Repeated usernames are served from the in-process lookup cache.
     """
     try:
-        search_criteria = f'StringCondition={{FieldName=Username,Value={username},ComparisonType=EXACT}}'
-        
-        cmd = [
-            'aws', 'connect', 'search-users',
-            '--instance-id', instance_id,
-            '--search-criteria', search_criteria
-        ]
-        
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            check=True,
-            timeout=30
-        )
-        
-        response = json.loads(result.stdout)
-        users = response.get('Users', [])
-        
-        if not users:
-            return None, f"No user found with username: {username}"
-        
-        if len(users) > 1:
-            return None, f"Multiple users found with username: {username}"
-        
-        user_id = users[0].get('Id')
-        if not user_id:
-            return None, f"User ID not found in response for username: {username}"
-        
-        return user_id, None
-        
-    except subprocess.CalledProcessError as e:
-        error_msg = e.stderr.strip() if e.stderr else f"Search command failed with return code {e.returncode}"
-        return None, error_msg
-    except subprocess.TimeoutExpired:
-        return None, "Search command timed out after 30 seconds"
-    except json.JSONDecodeError as e:
-        return None, f"Failed to parse search response: {str(e)}"
+        return _lookup_user_id(instance_id, username), None
+    except UserLookupError as e:
+        return None, str(e)
     except Exception as e:
         return None, f"Unexpected error during search: {str(e)}"
 
 
-def update_user_security_profile(instance_id, user_id, security_profile_id):
+def _username_condition(username):
+    """Build an exact-match search condition for a username."""
+    return {
+        'StringCondition': {
+            'FieldName': 'Username',
+            'Value': username,
+            'ComparisonType': 'EXACT'
+        }
+    }
+
+
+def resolve_users(instance_id, usernames):
     """
-    Update a single user's security profile using AWS CLI.
+    Resolve many usernames at once using batched search_users OR-conditions.
+    Returns a dict of username to the user's search summary, which includes
+    the Id and current SecurityProfileIds. Usernames that are missing,
+    ambiguous, or in a batch that failed are left out so the caller can
+    fall back to an individual search, which reports the precise error.
     """
-    try:
-        cmd = [
-            'aws', 'connect', 'update-user-security-profiles',
-            '--instance-id', instance_id,
-            '--user-id', user_id,
-            '--security-profile-ids', security_profile_id
-        ]
+    username_to_user = {}
+    unique_usernames = list(dict.fromkeys(usernames))
+    paginator = get_connect_client().get_paginator('search_users')
+    
+    for start in range(0, len(unique_usernames), SEARCH_BATCH_SIZE):
+        batch = unique_usernames[start:start + SEARCH_BATCH_SIZE]
+        wanted = set(batch)
+        matches = {}
         
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            check=True,
-            timeout=30
+        try:
+            pages = paginator.paginate(
+                InstanceId=instance_id,
+                SearchCriteria={
+                    'OrConditions': [_username_condition(username) for username in batch]
+                },
+                PaginationConfig={'PageSize': SEARCH_USERS_PAGE_SIZE}
+            )
+            for page in pages:
+                for user in page.get('Users', []):
+                    username = user.get('Username')
+                    if username in wanted and user.get('Id'):
+                        matches.setdefault(username, []).append(user)
+        except (ClientError, BotoCoreError) as e:
+            logging.warning("Batch user search failed, falling back to individual searches: %s", e)
+            continue
+        
+        for username, users in matches.items():
+            if len(users) == 1:
+                username_to_user[username] = users[0]
+    
+    return username_to_user
+
+
+def list_user_ids(instance_id):
+    """
+    Build a username to user ID map for the whole instance with list_users.
+    One paginated dump replaces per-row searches when the CSV covers a
+    large share of the instance's users.
+    """
+    username_to_id = {}
+    duplicates = set()
+    paginator = get_connect_client().get_paginator('list_users')
+    
+    for page in paginator.paginate(
+        InstanceId=instance_id,
+        PaginationConfig={'PageSize': LIST_USERS_PAGE_SIZE}
+    ):
+        for user in page.get('UserSummaryList', []):
+            username = user.get('Username')
+            if not username or not user.get('Id'):
+                continue
+            if username in username_to_id:
+                duplicates.add(username)
+            username_to_id[username] = user['Id']
+    
+    # Leave ambiguous usernames to the individual search so they are reported
+    for username in duplicates:
+        del username_to_id[username]
+    
+    return username_to_id
+
+
+def update_user_security_profile(instance_id, user_id, security_profile_ids):
+    """
+    Set a single user's security profiles using the Amazon Connect API.
+    The API replaces the user's existing profiles with the given list.
+    """
+    try:
+        get_connect_client().update_user_security_profiles(
+            InstanceId=instance_id,
+            UserId=user_id,
+            SecurityProfileIds=list(security_profile_ids)
         )
         
         return True, None
         
-    except subprocess.CalledProcessError as e:
-        error_msg = e.stderr.strip() if e.stderr else f"Command failed with return code {e.returncode}"
-        return False, error_msg
-    except subprocess.TimeoutExpired:
-        return False, "Command timed out after 30 seconds"
     except Exception as e:
-        return False, f"Unexpected error: {str(e)}"
+        return False, _update_error(e)
+
+
+def _update_error(e):
+    """Describe an exception raised by an update_user_security_profiles call."""
+    if isinstance(e, ClientError):
+        return format_client_error(e)
+    if isinstance(e, BotoCoreError):
+        return str(e)
+    return f"Unexpected error: {str(e)}"
+
+
+def user_cache_path(instance_id):
+    """Return the on-disk user ID cache path for an instance ID or ARN."""
+    # ARNs end in instance/<id>; keep only characters that are safe in a filename
+    instance = instance_id.rsplit('/', 1)[-1]
+    instance = re.sub(r'[^A-Za-z0-9_.-]', '_', instance)
+    return f".connect_user_cache_{instance}.json"
+
+
+def load_user_cache(cache_path, ttl):
+    """
+    Load cached username to (user_id, cached_at) entries from disk.
+    Entries older than ttl seconds are dropped. A missing or unreadable
+    cache is treated as empty.
+    """
+    try:
+        with open(cache_path, 'rb') as cache_file:
+            entries = _json.loads(cache_file.read())
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logging.warning("Ignoring unreadable user cache %s: %s", cache_path, e)
+        return {}
+    
+    if not isinstance(entries, dict):
+        logging.warning("Ignoring malformed user cache %s", cache_path)
+        return {}
+    
+    cutoff = time.time() - ttl
+    user_cache = {}
+    for username, entry in entries.items():
+        try:
+            user_id, cached_at = entry
+        except (TypeError, ValueError):
+            continue
+        if isinstance(cached_at, (int, float)) and cached_at >= cutoff:
+            user_cache[username] = (user_id, cached_at)
+    
+    return user_cache
+
+
+def save_user_cache(cache_path, user_cache):
+    """Atomically write username to (user_id, cached_at) entries to disk."""
+    tmp_path = f"{cache_path}.tmp"
+    data = _json.dumps({username: list(entry) for username, entry in user_cache.items()})
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    with open(tmp_path, 'wb') as cache_file:
+        cache_file.write(data)
+    os.replace(tmp_path, cache_path)
 
 
 def validate_csv_file(csv_file_path):
@@ -119,78 +382,333 @@ def validate_csv_file(csv_file_path):
         raise PermissionError(f"Cannot read CSV file: {csv_file_path}")
 
 
-def process_csv_file(instance_id, csv_file_path):
+def validate_rows(rows):
+    """
+    Validate (row_num, username, security_profile_id) rows read from the CSV.
+    Returns (clean_rows, errors) where clean_rows have stripped values and
+    duplicate username/security profile pairs removed, and errors holds the
+    logging arguments (format string and values) for every rejected row.
+    """
+    clean_rows = {}
+    errors = []
+    
+    for row_num, username, security_profile_id in rows:
+        # DictReader fills missing columns with None
+        if username is None or security_profile_id is None:
+            raw_values = [value for value in (username, security_profile_id) if value is not None]
+            errors.append(("FAILED: Row %s: Insufficient columns: %s", row_num, raw_values))
+            continue
+        
+        raw_values = [username, security_profile_id]
+        username = username.strip()
+        security_profile_id = security_profile_id.strip()
+        
+        if not username or not security_profile_id:
+            errors.append(("FAILED: Row %s: Empty values: %s", row_num, raw_values))
+            continue
+        
+        if not SECURITY_PROFILE_ID_PATTERN.match(security_profile_id):
+            errors.append(("FAILED: Row %s: Invalid security profile ID for user %s: %s", row_num, username, security_profile_id))
+            continue
+        
+        key = (username, security_profile_id)
+        if key in clean_rows:
+            logging.warning("Row %s: Duplicate of row %s, skipping", row_num, clean_rows[key][0])
+            continue
+        
+        clean_rows[key] = (row_num, username, security_profile_id)
+    
+    return list(clean_rows.values()), errors
+
+
+def has_header_row(sample):
+    """
+    Decide whether the CSV sample starts with a header row.
+    The first non-blank row is a header only if its first column is a known
+    column name; anything else is treated as data.
+    """
+    first_row = next((row for row in csv.reader(sample.splitlines()) if row), [])
+    return bool(first_row) and first_row[0].strip().lower() in _HEADER_TOKENS and len(first_row) > 1
+
+
+def handle_user(instance_id, username, security_profile_ids, user_id=None):
+    """
+    Update a single user's security profiles, searching for the user ID
+    if it was not already resolved.
+    Returns (success, user_id, log_args) where user_id is the ID that was used
+    (None if the user could not be found) and log_args is a format string
+    followed by its values, so the caller can log and tally the result
+    without building the message itself.
+    """
+    if not user_id:
+        # Search for user ID by username
+        user_id, search_error = search_user_by_username(instance_id, username)
+        
+        if not user_id:
+            return False, None, ("FAILED: Could not find user %s - %s", username, search_error)
+    
+    success, error = update_user_security_profile(instance_id, user_id, security_profile_ids)
+    return _update_result(username, user_id, security_profile_ids, success, error)
+
+
+async def handle_user_async(client, instance_id, username, security_profile_ids, user_id=None):
+    """
+    Async counterpart of handle_user using an aioboto3 Connect client.
+    The rare fallback search runs on a worker thread so it keeps using the
+    shared lookup cache.
+    """
+    if not user_id:
+        user_id, search_error = await asyncio.to_thread(search_user_by_username, instance_id, username)
+        
+        if not user_id:
+            return False, None, ("FAILED: Could not find user %s - %s", username, search_error)
+    
+    try:
+        await client.update_user_security_profiles(
+            InstanceId=instance_id,
+            UserId=user_id,
+            SecurityProfileIds=list(security_profile_ids)
+        )
+        success, error = True, None
+    except Exception as e:
+        success, error = False, _update_error(e)
+    
+    return _update_result(username, user_id, security_profile_ids, success, error)
+
+
+def _update_result(username, user_id, security_profile_ids, success, error):
+    """Build the (success, user_id, log_args) result for a user update."""
+    profiles = ', '.join(security_profile_ids)
+    if success:
+        return True, user_id, ("SUCCESS: Updated user %s (ID: %s) with security profile %s", username, user_id, profiles)
+    
+    return False, user_id, ("FAILED: User %s (ID: %s), Security Profile %s - %s", username, user_id, profiles, error)
+
+
+def update_users(instance_id, plan, username_to_id, on_result, max_workers=MAX_WORKERS):
+    """
+    Update every user in plan on a thread pool.
+    on_result(username, success, user_id, log_args) is called on the calling thread
+    as each update finishes, so it needs no locking.
+    """
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    futures = {
+        executor.submit(
+            handle_user, instance_id, username, security_profile_ids,
+            username_to_id.get(username)
+        ): username
+        for username, security_profile_ids in plan.items()
+    }
+    unreported = set(futures)
+    
+    try:
+        for future in as_completed(futures):
+            unreported.discard(future)
+            on_result(futures[future], *future.result())
+    except BaseException:
+        # On Ctrl-C (or any error) drop the queued updates instead of letting
+        # shutdown run them, then report the ones already in flight so the
+        # log matches what was actually applied.
+        executor.shutdown(wait=False, cancel_futures=True)
+        in_flight = [future for future in unreported if not future.cancelled()]
+        for future in wait(in_flight).done:
+            if future.exception() is None:
+                on_result(futures[future], *future.result())
+        raise
+    
+    executor.shutdown()
+
+
+async def update_users_async(instance_id, plan, username_to_id, on_result, concurrency=ASYNC_CONCURRENCY):
+    """
+    Update every user in plan with aioboto3, keeping up to concurrency
+    requests in flight. on_result is called on the event loop thread.
+    If the run is cancelled, requests already in flight finish and are
+    reported before the cancellation propagates.
+    """
+    config = CLIENT_CONFIG.merge(Config(max_pool_connections=concurrency))
+    semaphore = asyncio.Semaphore(concurrency)
+    session = aioboto3.Session()
+    
+    async with session.client('connect', config=config) as client:
+        async def update_one(username, security_profile_ids):
+            async with semaphore:
+                request = asyncio.ensure_future(handle_user_async(
+                    client, instance_id, username, security_profile_ids,
+                    username_to_id.get(username)
+                ))
+                try:
+                    result = await asyncio.shield(request)
+                except asyncio.CancelledError:
+                    # On Ctrl-C, updates still waiting for the semaphore are
+                    # dropped, but one already sent is allowed to finish and
+                    # is reported, matching the thread pool path.
+                    on_result(username, *(await request))
+                    raise
+            on_result(username, *result)
+        
+        # return_exceptions keeps gather waiting for the in-flight updates
+        # when some waiting ones are cancelled; real errors are re-raised.
+        results = await asyncio.gather(*(
+            update_one(username, security_profile_ids)
+            for username, security_profile_ids in plan.items()
+        ), return_exceptions=True)
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+
+
+def process_csv_file(instance_id, csv_file_path, max_workers=MAX_WORKERS, user_lookup='list',
+                     use_cache=True, cache_ttl=USER_CACHE_TTL, use_async=False,
+                     skip_unchanged=False):
     """
     Process the CSV file and update user security profiles.
+    Rows are collected and grouped by user first, then each user is
+    updated concurrently with all of their profiles in one call.
+    user_lookup selects how user IDs are resolved:
+    'list' snapshots every user with list_users, 'search' runs batched searches.
+    When use_cache is set, resolved user IDs are kept on disk for cache_ttl seconds.
+    use_async runs the updates with aioboto3 instead of a thread pool.
+    skip_unchanged searches every user for their current profiles and skips
+    users that already have exactly the requested ones.
+    Returns (success_count, error_count, skipped_count).
     """
     success_count = 0
     error_count = 0
+    skipped_count = 0
+    rows = []
     
-    with open(csv_file_path, 'r', newline='', encoding='utf-8') as csvfile:
-        reader = csv.reader(csvfile)
-        
-        # Check if first row is header
-        first_row = next(reader, None)
-        if not first_row:
+    with open(csv_file_path, 'r', newline='', encoding='utf-8', buffering=CSV_READ_BUFFER_SIZE) as csvfile:
+        sample = csvfile.read(4096)
+        if not sample.strip():
             logging.warning("CSV file is empty")
-            return success_count, error_count
+            return success_count, error_count, skipped_count
+        csvfile.seek(0)
+        
+        reader = csv.DictReader(csvfile, fieldnames=CSV_FIELDNAMES)
         
         # Skip header row if it contains column names
-        if first_row[0].lower() in ['user_id', 'userid', 'username'] and len(first_row) > 1:
+        if has_header_row(sample):
+            next(reader, None)
             logging.info("Detected header row, skipping...")
-        else:
-            # Process first row as data
-            if len(first_row) >= 2:
-                username = first_row[0].strip()
-                security_profile_id = first_row[1].strip()
-                
-                if username and security_profile_id:
-                    # Search for user ID by username
-                    user_id, search_error = search_user_by_username(instance_id, username)
-                    
-                    if user_id:
-                        success, error = update_user_security_profile(instance_id, user_id, security_profile_id)
-                        if success:
-                            logging.info(f"SUCCESS: Updated user {username} (ID: {user_id}) with security profile {security_profile_id}")
-                            success_count += 1
-                        else:
-                            logging.error(f"FAILED: User {username} (ID: {user_id}), Security Profile {security_profile_id} - {error}")
-                            error_count += 1
-                    else:
-                        logging.error(f"FAILED: Could not find user {username} - {search_error}")
-                        error_count += 1
-                else:
-                    logging.warning(f"Skipping row with empty values: {first_row}")
         
-        # Process remaining rows
-        for row_num, row in enumerate(reader, start=2):
-            if len(row) < 2:
-                logging.warning(f"Row {row_num}: Insufficient columns, skipping: {row}")
-                continue
-            
-            username = row[0].strip()
-            security_profile_id = row[1].strip()
-            
-            if not username or not security_profile_id:
-                logging.warning(f"Row {row_num}: Empty values, skipping: {row}")
-                continue
-            
-            # Search for user ID by username
-            user_id, search_error = search_user_by_username(instance_id, username)
-            
-            if user_id:
-                success, error = update_user_security_profile(instance_id, user_id, security_profile_id)
-                if success:
-                    logging.info(f"SUCCESS: Updated user {username} (ID: {user_id}) with security profile {security_profile_id}")
-                    success_count += 1
-                else:
-                    logging.error(f"FAILED: User {username} (ID: {user_id}), Security Profile {security_profile_id} - {error}")
-                    error_count += 1
+        for row in reader:
+            rows.append((reader.line_num, row['username'], row['security_profile_id']))
+    
+    # Catch malformed rows locally before any API call is made
+    rows, validation_errors = validate_rows(rows)
+    for log_args in validation_errors:
+        logging.error(*log_args)
+    error_count += len(validation_errors)
+    
+    if not rows:
+        logging.warning("No valid rows to process")
+        return success_count, error_count, skipped_count
+    
+    # The update call replaces a user's profiles, so every profile listed for
+    # the same username has to be sent together in one call.
+    plan = defaultdict(list)
+    for _, username, security_profile_id in rows:
+        plan[username].append(security_profile_id)
+    
+    usernames = list(plan)
+    
+    cache_path = user_cache_path(instance_id) if use_cache else None
+    user_cache = load_user_cache(cache_path, cache_ttl) if cache_path else {}
+    current_profiles = {}
+    
+    if skip_unchanged:
+        # Only the batched search returns current profiles, so every user
+        # is searched; the cache is still refreshed with the results.
+        username_to_id = {}
+    else:
+        # User IDs from previous runs are reused while they are within the TTL
+        username_to_id = {username: user_cache[username][0] for username in usernames if username in user_cache}
+        if username_to_id:
+            logging.info("Loaded %s user IDs from cache %s", len(username_to_id), cache_path)
+    missing = [username for username in usernames if username not in username_to_id]
+    
+    # Resolve the remaining usernames up front so each user only needs the
+    # update call. Anything not found here (e.g. users added after the
+    # snapshot) falls back to an individual search in handle_user.
+    resolved = {}
+    if missing:
+        resolved = None
+        
+        if user_lookup == 'list' and not skip_unchanged:
+            try:
+                resolved = list_user_ids(instance_id)
+                logging.info("Loaded %s users from instance", len(resolved))
+            except (ClientError, BotoCoreError) as e:
+                logging.warning("Listing users failed, falling back to batched search: %s", e)
+        
+        if resolved is None:
+            users = resolve_users(instance_id, missing)
+            resolved = {username: user['Id'] for username, user in users.items()}
+            current_profiles = {
+                username: set(user.get('SecurityProfileIds') or [])
+                for username, user in users.items()
+            }
+        
+        for username in missing:
+            if username in resolved:
+                username_to_id[username] = resolved[username]
+    
+    # The update replaces the user's profiles, so it is only a no-op when
+    # the user already has exactly the requested set
+    for username in list(plan):
+        security_profile_ids = plan[username]
+        if username in current_profiles and set(security_profile_ids) == current_profiles[username]:
+            logging.info(
+                "NOOP: User %s (ID: %s) already has security profile %s",
+                username, username_to_id[username], ', '.join(security_profile_ids),
+                extra=PER_ROW_LOG
+            )
+            skipped_count += 1
+            del plan[username]
+    
+    failed_usernames = set()
+    # IDs that only the per-user fallback search found, e.g. users added
+    # after the snapshot, so the next run does not search for them again
+    searched_ids = {}
+    
+    def record_result(username, success, user_id, log_args):
+        nonlocal success_count, error_count
+        if success:
+            logging.info(*log_args, extra=PER_ROW_LOG)
+            success_count += 1
+            if username not in username_to_id:
+                searched_ids[username] = user_id
+        else:
+            logging.error(*log_args)
+            error_count += 1
+            failed_usernames.add(username)
+        advance()
+    
+    # Each user is at least one network round-trip, so run them concurrently.
+    # The cache is saved even if the run is interrupted.
+    try:
+        with progress_bar(len(plan)) as advance:
+            if use_async:
+                asyncio.run(update_users_async(instance_id, plan, username_to_id, record_result))
             else:
-                logging.error(f"FAILED: Could not find user {username} - {search_error}")
-                error_count += 1
+                update_users(instance_id, plan, username_to_id, record_result, max_workers=max_workers)
+    finally:
+        if cache_path:
+            # Drop IDs for failed users in case the cached ID was stale
+            now = time.time()
+            for username, user_id in resolved.items():
+                user_cache[username] = (user_id, now)
+            for username, user_id in searched_ids.items():
+                user_cache[username] = (user_id, now)
+            for username in failed_usernames:
+                user_cache.pop(username, None)
+            try:
+                save_user_cache(cache_path, user_cache)
+            except OSError as e:
+                logging.warning("Could not write user cache %s: %s", cache_path, e)
     
-    return success_count, error_count
+    return success_count, error_count, skipped_count
 
 
 def main():
@@ -219,48 +737,100 @@ CSV file format:
         help='Path to CSV file containing username and security_profile_id columns'
     )
     
+    parser.add_argument(
+        '--user-lookup',
+        choices=['list', 'search'],
+        default='list',
+        help='How to resolve usernames: list all users once (default) or search for the CSV usernames in batches'
+    )
+    
+    parser.add_argument(
+        '--skip-unchanged',
+        action='store_true',
+        help='Search each user for their current security profiles and skip users that already have exactly the requested ones. '
+             'Implies --user-lookup search and ignores cached user IDs (the cache is still updated)'
+    )
+    
+    parser.add_argument(
+        '--async',
+        dest='use_async',
+        action='store_true',
+        help='Run the updates with asyncio and aioboto3 instead of a thread pool (requires aioboto3)'
+    )
+    
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='Do not read or write the on-disk username to user ID cache'
+    )
+    
+    parser.add_argument(
+        '--cache-ttl',
+        type=int,
+        default=USER_CACHE_TTL,
+        help=f'Seconds a cached user ID stays valid (default: {USER_CACHE_TTL})'
+    )
+    
     args = parser.parse_args()
     
+    if args.use_async and aioboto3 is None:
+        parser.error("--async requires aioboto3 (pip install aioboto3)")
+    
     # Setup logging
     log_filename = setup_logging()
     
     logging.info("=" * 60)
     logging.info("Amazon Connect Security Profile Updater Started")
     logging.info("=" * 60)
-    logging.info(f"Instance ID: {args.instance_id}")
-    logging.info(f"CSV File: {args.csv_file}")
-    logging.info(f"Log File: {log_filename}")
+    logging.info("Instance ID: %s", args.instance_id)
+    logging.info("CSV File: %s", args.csv_file)
+    if args.skip_unchanged:
+        logging.info("User Lookup: search (forced by --skip-unchanged)")
+    else:
+        logging.info("User Lookup: %s", args.user_lookup)
+    if args.no_cache:
+        logging.info("User ID Cache: disabled")
+    elif args.skip_unchanged:
+        logging.info("User ID Cache: write only (reads skipped by --skip-unchanged)")
+    else:
+        logging.info("User ID Cache: %s", user_cache_path(args.instance_id))
+    logging.info("Log File: %s", log_filename)
     
     try:
         # Validate inputs
         validate_csv_file(args.csv_file)
         
         # Process the CSV file
-        success_count, error_count = process_csv_file(args.instance_id, args.csv_file)
+        success_count, error_count, skipped_count = process_csv_file(
+            args.instance_id, args.csv_file, user_lookup=args.user_lookup,
+            use_cache=not args.no_cache, cache_ttl=args.cache_ttl,
+            use_async=args.use_async, skip_unchanged=args.skip_unchanged
+        )
         
         # Summary
-        total_processed = success_count + error_count
+        total_processed = success_count + error_count + skipped_count
         logging.info("=" * 60)
         logging.info("SUMMARY")
         logging.info("=" * 60)
-        logging.info(f"Total processed: {total_processed}")
-        logging.info(f"Successful updates: {success_count}")
-        logging.info(f"Failed updates: {error_count}")
+        logging.info("Total processed: %s", total_processed)
+        logging.info("Successful updates: %s", success_count)
+        logging.info("Failed updates: %s", error_count)
+        logging.info("Skipped (already up to date): %s", skipped_count)
         
         if error_count > 0:
-            logging.warning(f"Process completed with {error_count} errors. Check log for details.")
+            logging.warning("Process completed with %s errors. Check log for details.", error_count)
             sys.exit(1)
         else:
             logging.info("All updates completed successfully!")
             
     except FileNotFoundError as e:
-        logging.error(f"File error: {e}")
+        logging.error("File error: %s", e)
         sys.exit(1)
     except PermissionError as e:
-        logging.error(f"Permission error: {e}")
+        logging.error("Permission error: %s", e)
         sys.exit(1)
     except Exception as e:
-        logging.error(f"Unexpected error: {e}")
+        logging.error("Unexpected error: %s", e)
         sys.exit(1)
 
 
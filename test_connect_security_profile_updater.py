@@ -0,0 +1,174 @@
+import os
+import tempfile
+import time
+import unittest
+
+import connect_security_profile_updater as updater
+
+PROFILE_ID = 'a1b2c3d4-e5f6-7890-abcd-ef1234567890'
+
+
+class HasHeaderRowTest(unittest.TestCase):
+
+    def test_single_data_row_is_not_a_header(self):
+        self.assertFalse(updater.has_header_row(f"john.doe,{PROFILE_ID}\n"))
+
+    def test_single_data_row_with_header(self):
+        self.assertTrue(updater.has_header_row(f"username,security_profile_id\njohn.doe,{PROFILE_ID}\n"))
+
+    def test_known_header_names(self):
+        for header in ('username', 'user_id', 'UserID', ' Username '):
+            with self.subTest(header=header):
+                self.assertTrue(updater.has_header_row(f"{header},security_profile_id\njohn.doe,{PROFILE_ID}\n"))
+
+    def test_data_rows_without_header(self):
+        sample = f"john.doe,{PROFILE_ID}\njane.doe,{PROFILE_ID}\n"
+        self.assertFalse(updater.has_header_row(sample))
+
+    def test_unknown_header_is_data(self):
+        self.assertFalse(updater.has_header_row(f"login,profile\njohn.doe,{PROFILE_ID}\n"))
+
+    def test_header_token_needs_second_column(self):
+        self.assertFalse(updater.has_header_row("username\n"))
+
+    def test_leading_blank_line_is_ignored(self):
+        self.assertTrue(updater.has_header_row(f"\nusername,security_profile_id\njohn.doe,{PROFILE_ID}\n"))
+
+    def test_empty_sample(self):
+        self.assertFalse(updater.has_header_row(""))
+
+
+class ValidateRowsTest(unittest.TestCase):
+
+    def test_clean_rows_are_stripped(self):
+        rows, errors = updater.validate_rows([(2, ' john.doe ', f' {PROFILE_ID} ')])
+        self.assertEqual(rows, [(2, 'john.doe', PROFILE_ID)])
+        self.assertEqual(errors, [])
+
+    def test_short_row(self):
+        rows, errors = updater.validate_rows([(3, 'john.doe', None)])
+        self.assertEqual(rows, [])
+        self.assertEqual(errors, [("FAILED: Row %s: Insufficient columns: %s", 3, ['john.doe'])])
+
+    def test_empty_values(self):
+        rows, errors = updater.validate_rows([(4, '', PROFILE_ID), (5, 'john.doe', '  ')])
+        self.assertEqual(rows, [])
+        self.assertEqual(errors, [
+            ("FAILED: Row %s: Empty values: %s", 4, ['', PROFILE_ID]),
+            ("FAILED: Row %s: Empty values: %s", 5, ['john.doe', '  ']),
+        ])
+
+    def test_invalid_security_profile_id(self):
+        rows, errors = updater.validate_rows([(6, 'john.doe', 'not-a-uuid')])
+        self.assertEqual(rows, [])
+        self.assertEqual(errors, [
+            ("FAILED: Row %s: Invalid security profile ID for user %s: %s", 6, 'john.doe', 'not-a-uuid'),
+        ])
+
+    def test_uppercase_security_profile_id_is_valid(self):
+        rows, errors = updater.validate_rows([(2, 'john.doe', PROFILE_ID.upper())])
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(errors, [])
+
+    def test_duplicates_keep_first_row(self):
+        other_profile = '11111111-2222-3333-4444-555555555555'
+        with self.assertLogs(level='WARNING') as logs:
+            rows, errors = updater.validate_rows([
+                (2, 'john.doe', PROFILE_ID),
+                (3, 'john.doe', other_profile),
+                (4, 'john.doe', PROFILE_ID),
+            ])
+        self.assertEqual(rows, [(2, 'john.doe', PROFILE_ID), (3, 'john.doe', other_profile)])
+        self.assertEqual(errors, [])
+        self.assertIn("Row 4: Duplicate of row 2", logs.output[0])
+
+
+class UserCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.cache_path = os.path.join(self.tmpdir.name, 'cache.json')
+
+    def test_round_trip(self):
+        now = time.time()
+        updater.save_user_cache(self.cache_path, {'john.doe': ('user-1', now)})
+        self.assertEqual(updater.load_user_cache(self.cache_path, 60), {'john.doe': ('user-1', now)})
+        self.assertFalse(os.path.exists(f"{self.cache_path}.tmp"))
+
+    def test_expired_entries_are_dropped(self):
+        now = time.time()
+        updater.save_user_cache(self.cache_path, {
+            'fresh': ('user-1', now),
+            'stale': ('user-2', now - 120),
+        })
+        self.assertEqual(updater.load_user_cache(self.cache_path, 60), {'fresh': ('user-1', now)})
+
+    def test_missing_cache_is_empty(self):
+        self.assertEqual(updater.load_user_cache(self.cache_path, 60), {})
+
+    def test_unreadable_cache_is_empty(self):
+        with open(self.cache_path, 'w', encoding='utf-8') as cache_file:
+            cache_file.write('not json')
+        with self.assertLogs(level='WARNING'):
+            self.assertEqual(updater.load_user_cache(self.cache_path, 60), {})
+
+    def test_cache_path_from_arn(self):
+        arn = 'arn:aws:connect:us-east-1:123456789012:instance/12345678-1234-1234-1234-123456789012'
+        self.assertEqual(
+            updater.user_cache_path(arn),
+            '.connect_user_cache_12345678-1234-1234-1234-123456789012.json'
+        )
+
+
+class ProcessCsvFileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+
+    def read_rows(self, content):
+        csv_path = os.path.join(self.tmpdir.name, 'users.csv')
+        with open(csv_path, 'w', newline='', encoding='utf-8') as csvfile:
+            csvfile.write(content)
+
+        # Stop before any API call by capturing the grouped plan
+        captured = {}
+
+        def fake_update_users(instance_id, plan, username_to_id, on_result, max_workers=None):
+            captured.update(plan)
+
+        original = updater.update_users
+        updater.update_users = fake_update_users
+        self.addCleanup(setattr, updater, 'update_users', original)
+        original_list = updater.list_user_ids
+        updater.list_user_ids = lambda instance_id: {}
+        self.addCleanup(setattr, updater, 'list_user_ids', original_list)
+
+        updater.process_csv_file('instance', csv_path, use_cache=False)
+        return captured
+
+    def test_single_row_without_header_is_processed(self):
+        self.assertEqual(self.read_rows(f"john.doe,{PROFILE_ID}\n"), {'john.doe': [PROFILE_ID]})
+
+    def test_row_numbers_match_file_lines(self):
+        content = f"username,security_profile_id\n\njohn.doe,not-a-uuid\n"
+        with self.assertLogs(level='ERROR') as logs:
+            self.read_rows(content)
+        self.assertIn("Row 3: Invalid security profile ID", logs.output[0])
+
+    def test_rows_are_grouped_by_user(self):
+        other_profile = '11111111-2222-3333-4444-555555555555'
+        content = f"john.doe,{PROFILE_ID}\njane.doe,{PROFILE_ID}\njohn.doe,{other_profile}\n"
+        self.assertEqual(self.read_rows(content), {
+            'john.doe': [PROFILE_ID, other_profile],
+            'jane.doe': [PROFILE_ID],
+        })
+
+    def test_single_row_with_header_is_processed(self):
+        content = f"username,security_profile_id\njohn.doe,{PROFILE_ID}\n"
+        self.assertEqual(self.read_rows(content), {'john.doe': [PROFILE_ID]})
+
+
+if __name__ == '__main__':
+    unittest.main()